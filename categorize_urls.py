@@ -9,7 +9,12 @@ terminal (where we set the granularity depth level to 5):
 
     python categorize_urls.py --depth 5
 
-The same result can be achieved by setting the categorization_depth variable
+Results are saved to sitemap_layers.parquet for the visualize_urls.py script.
+A CSV copy can also be saved to sitemap_layers.csv with:
+
+    python categorize_urls.py --depth 5 --csv
+
+The same result can be achieved by setting the variables
 manually at the head of this file and running the script with:
 
     python categorize_urls.py
@@ -21,70 +26,70 @@ from __future__ import print_function
 # Set global variables
 
 categorization_depth = 4
+export_csv = False # Also save results to sitemap_layers.csv?
 
 
 # Import external library dependencies
 
 import pandas as pd
 import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument('--depth', type=int, default=categorization_depth,
-                    help='Number of layers deep to categorize')
-args = parser.parse_args()
-
-
-# Update variables with arguments if included
-
-categorization_depth = args.depth
-
 
 
 # Main script functions
 
 
-def peel_layers(urls, layers=3):
+def peel_layers(urls, layers=3, export_csv=False):
     ''' Builds a dataframe containing all unique page identifiers up
     to a specified depth and counts the number of sub-pages for each.
-    Prints results to a CSV file.
+    Prints results to a parquet file, and optionally a CSV file.
 
-    urls : list
-        List of page URLs.
+    urls : Series
+        Series of page URLs.
 
     layers : int
         Depth of automated URL search. Large values for this parameter
         may cause long runtimes depending on the number of URLs.
-    '''
-
-    # Store results in a dataframe
-    sitemap_layers = pd.DataFrame()
 
-    # Get base levels
-    bases = pd.Series([url.split('//')[-1].split('/')[0] for url in urls])
-    sitemap_layers[0] = bases
+    export_csv : bool
+        Also print results to sitemap_layers.csv.
+    '''
 
-    # Get specified number of layers
-    for layer in range(1, layers+1):
+    # Strip the scheme, then split each URL into its base and path layers
+    # in a single pass. Anything deeper than the requested layers is left
+    # in a trailing column that gets dropped.
+    paths = urls.str.split('//', n=1).str[-1]
+    sitemap_layers = paths.str.split('/', n=layers+1, expand=True)
 
-        page_layer = []
-        for url, base in zip(urls, bases):
-            try:
-                page_layer.append(url.split(base)[-1].split('/')[layer])
-            except:
-                # There is nothing that deep!
-                page_layer.append('')
+    # Keep the base + specified number of layers, missing layers are blank
+    sitemap_layers = sitemap_layers.reindex(columns=range(0, layers+1))\
+                     .fillna('')
 
-        sitemap_layers[layer] = page_layer
+    # Layers have few distinct values, so group on categorical codes
+    for layer in sitemap_layers.columns:
+        sitemap_layers[layer] = sitemap_layers[layer].astype('category')
 
     # Count and drop duplicate rows + sort
-    sitemap_layers = sitemap_layers.groupby(list(range(0, layers+1)))[0].count()\
+    sitemap_layers = sitemap_layers.groupby(list(range(0, layers+1)), observed=True,
+                                            sort=False).size()\
                      .rename('counts').reset_index()\
-                     .sort_values('counts', ascending=False)\
-                     .sort_values(list(range(0, layers)), ascending=True)\
+                     .sort_values(list(range(0, layers)) + ['counts'],
+                                  ascending=[True]*layers + [False])\
                      .reset_index(drop=True)
 
-    # Convert column names to string types and export
-    sitemap_layers.columns = [str(col) for col in sitemap_layers.columns]
-    sitemap_layers.to_csv('sitemap_layers.csv', index=False)
+    # Convert column names to string types
+    col_names = [str(layer) for layer in range(0, layers+1)]
+    sitemap_layers.columns = col_names + ['counts']
+
+    # Store blank layers as missing values, as they would be read from CSV
+    for col in col_names:
+        if '' in sitemap_layers[col].cat.categories:
+            sitemap_layers[col] = sitemap_layers[col].cat.remove_categories([''])
+
+    # Export, writing the parquet file last so visualize_urls.py picks it
+    # over the CSV copy
+    if export_csv:
+        sitemap_layers.to_csv('sitemap_layers.csv', index=False)
+    sitemap_layers.to_parquet('sitemap_layers.parquet', index=False)
 
     # Return the dataframe
     return sitemap_layers
@@ -92,13 +97,25 @@ def peel_layers(urls, layers=3):
 
 def main():
 
-    sitemap_urls = open('sitemap_urls.dat', 'r').read().splitlines()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--depth', type=int, default=categorization_depth,
+                        help='Number of layers deep to categorize')
+    parser.add_argument('--csv', action='store_true', default=export_csv,
+                        help='Also save results to sitemap_layers.csv')
+    args = parser.parse_args()
+
+    # One URL per line, read whole so no character acts as a delimiter
+    with open('sitemap_urls.dat', 'r') as f:
+        sitemap_urls = pd.Series(f.read().splitlines(), name='url', dtype=str)
     print('Loaded {:,} URLs'.format(len(sitemap_urls)))
 
-    print('Categorizing up to a depth of %d' % categorization_depth)
+    print('Categorizing up to a depth of %d' % args.depth)
     sitemap_layers = peel_layers(urls=sitemap_urls,
-                                 layers=categorization_depth)
-    print('Printed {:,} rows of data to sitemap_layers.csv'.format(len(sitemap_layers)))
+                                 layers=args.depth,
+                                 export_csv=args.csv)
+    print('Printed {:,} rows of data to sitemap_layers.parquet'.format(len(sitemap_layers)))
+    if args.csv:
+        print('Printed {:,} rows of data to sitemap_layers.csv'.format(len(sitemap_layers)))
 
 
 if __name__ == '__main__':
@@ -14,6 +14,11 @@ If the XML sitemap files are in gzip format, the script should be run like this:
 
     python extract_urls.py --url "site.com/sitemap-index.xml" --gzip
 
+Compressed files are parsed as they are downloaded. To also keep a copy of
+each file in the gzip-sitemaps folder, add the cache argument:
+
+    python extract_urls.py --url "site.com/sitemap-index.xml" --gzip --cache
+
 The same results can be achieved by editing the variables at the head of this
 file and running the script with:
 
@@ -28,159 +33,288 @@ from __future__ import print_function
 sitemap_url = 'https://www.sportchek.ca/sitemap.xml'
 sitemap_is_index = True # Does sitemap_url point to other XML pages?
 sitemap_is_gzip = False # Are the XML pages in compressed format?
+cache_gzip = False # Save the compressed XML pages to gzip-sitemaps?
 
 
 # Import external library dependencies
 
 import requests
-from bs4 import BeautifulSoup
+import urllib3
+from requests.adapters import HTTPAdapter
+from lxml import etree
 
-# Required if sitemap_is_gzip == True
 import os
+
+# Required if sitemap_is_gzip == True
 import gzip
-import glob
+import zlib
+import shutil
+import hashlib
+import tempfile
+
+# For fetching sub-sitemaps concurrently
+from concurrent.futures import ThreadPoolExecutor
 
 # For argument passing
 import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument('--url', type=str,
-                    help='Link to XML sitemap')
-parser.add_argument('--not_index', action='store_true',
-                    help='Does the given URL contain the sitemap directly?')
-parser.add_argument('--gzip', action='store_true',
-                    help='Are the XML files in gzip (.gz) format?')
-args = parser.parse_args()
+from functools import partial
+
+
 
+# Shared HTTP session so sub-sitemaps reuse the same pooled connection
 
-# Update variables with arguments if specified
+MAX_WORKERS = 16 # Number of sub-sitemaps fetched concurrently
 
-if args.url:
-    sitemap_url = args.url
-else:
-    print('No sitemap URL argument passed, using %s.' % sitemap_url)
-    print('Read usage details in file header for more information on passing arguments.')
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+SESSION.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+SESSION.headers['Accept-Encoding'] = 'gzip'
 
-if args.not_index:
-    sitemap_is_index = False
+# Sitemap <loc> tags, namespaced or bare, but not extensions like <image:loc>
+LOC_TAGS = ('{http://www.sitemaps.org/schemas/sitemap/0.9}loc', 'loc')
 
-if args.gzip:
-    sitemap_is_gzip = True
+# Errors that skip a single sub-sitemap with a warning instead of stopping the
+# run: failed requests, connections dropped while streaming the body (raised
+# by urllib3 directly), corrupt or truncated gzip data and invalid XML.
+# Anything else, such as a local file error, still stops the run.
+SKIPPED_ERRORS = (requests.RequestException, urllib3.exceptions.HTTPError,
+                  gzip.BadGzipFile, zlib.error, EOFError,
+                  etree.XMLSyntaxError)
 
 
 
 # Main script functions
 
 
+def parse_locs(f):
+    ''' Stream <loc> tag contents out of a file-like XML object. Entries are
+    deleted from the tree once read so the full tree is never held in
+    memory. '''
+
+    links = []
+    for _, element in etree.iterparse(f, tag=LOC_TAGS):
+        # Skip empty tags and trim whitespace around the URL
+        link = (element.text or '').strip()
+        if link:
+            links.append(link)
+        element.clear()
+
+        # Drop the <url>/<sitemap> entries that have already been read
+        parent = element.getparent()
+        if parent is not None and parent.getparent() is not None:
+            while parent.getprevious() is not None:
+                del parent.getparent()[0]
+    return links
+
+
 def get_urls(url):
     ''' Extract URLs from XML by looking for <loc> tag contents. '''
 
-    page = requests.get(url)
-    soup = BeautifulSoup(page.content, 'html.parser')
-    links = [element.text for element in soup.findAll('loc')]
+    with SESSION.get(url, stream=True) as page:
+        page.raise_for_status()
+        page.raw.decode_content = True
+        links = parse_locs(page.raw)
     return links
 
 
-def get_all_urls(sitemap_url):
-    ''' Loop over get_urls function for all XML pages. '''
+def get_sub_urls(url):
+    ''' Run get_urls on a sub-sitemap, skipping it with a warning if it
+    cannot be downloaded or parsed. '''
+
+    try:
+        return get_urls(url)
+    except SKIPPED_ERRORS as e:
+        print('Warning - skipping unreadable XML file %s (%s)' % (url, e))
+        return []
+
+
+def split_gzip_urls(urls):
+    ''' Partition a list of XML page URLs into gzip and non-gzip files. '''
+
+    urls_gz, urls_not_gz = [], []
+    for url in urls:
+        if url.endswith('.gz'):
+            urls_gz.append(url)
+        else:
+            urls_not_gz.append(url)
+    return urls_gz, urls_not_gz
+
+
+def iter_all_urls(sitemap_url):
+    ''' Loop over get_sub_urls function for all XML pages, yielding the URLs
+    found on each page as it is processed. '''
 
     # Get list of .xml files
-    urls = get_urls(sitemap_url)
-    urls_not_gz = [u for u in urls if u[-3:] != '.gz']
-    for i, url in enumerate((set(urls) - set(urls_not_gz))):
+    urls_gz, urls_not_gz = split_gzip_urls(get_urls(sitemap_url))
+    for i, url in enumerate(urls_gz):
         if i == 0:
             print('Warning - ignoring the following gzip files:')
         print(url)
     urls = urls_not_gz
 
-    sitemap_urls = []
-    for i, url in enumerate(urls):
-        links = get_urls(url)
-        print('Searched through %s XML file(s)' % (i+1), end='\r')
-        sitemap_urls += links
-
-    return sitemap_urls
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        for i, links in enumerate(ex.map(get_sub_urls, urls)):
+            if (i+1) % 64 == 0 or i+1 == len(urls):
+                print('Searched through %s XML file(s)' % (i+1), end='\r')
+            yield links
 
 
 def get_gzip_urls(f_):
     ''' Extract URLs from gzip XML by looking for <loc> tag contents. '''
 
-    f = gzip.open(f_)
-    soup = BeautifulSoup(f.read(), 'html.parser')
-    links = [item.text for item in soup.findAll('loc')]
+    with gzip.open(f_) as f:
+        links = parse_locs(f)
     return links
 
 
-def get_all_gzip_urls(sitemap_url):
-    ''' Loop over get_gzip_urls function for all XML pages. Index XML page
-    is assumed to be unzipped. '''
+def download_gzip(url):
+    ''' Save a gzip XML page to the gzip-sitemaps folder. The file name is
+    prefixed with a hash of the URL so that pages with the same name in
+    different folders do not overwrite each other. '''
+
+    filename = 'gzip-sitemaps/%s-%s' % (hashlib.md5(url.encode('utf-8')).hexdigest()[:8],
+                                        url.rpartition('/')[2])
+
+    # Download to a temporary file and move it into place once complete, so
+    # the same URL fetched twice never leaves a partly written file
+    f = tempfile.NamedTemporaryFile(dir='gzip-sitemaps', suffix='.tmp', delete=False)
+    try:
+        with f, SESSION.get(url, stream=True) as page:
+            page.raise_for_status()
+            page.raw.decode_content = True
+            shutil.copyfileobj(page.raw, f, length=1<<16)
+        os.replace(f.name, filename)
+    except BaseException:
+        if os.path.exists(f.name):
+            os.remove(f.name)
+        raise
+    return filename
+
+
+def fetch_gzip_urls(url, cache=False):
+    ''' Extract URLs from a remote gzip XML page. The download is parsed as
+    it streams in, unless cache is set in which case it is first saved to
+    the gzip-sitemaps folder. '''
+
+    if cache:
+        return get_gzip_urls(download_gzip(url))
+
+    with SESSION.get(url, stream=True) as page:
+        page.raise_for_status()
+        page.raw.decode_content = True
+        with gzip.GzipFile(fileobj=page.raw) as f:
+            links = parse_locs(f)
+    return links
+
+
+def fetch_sub_gzip_urls(url, cache=False):
+    ''' Run fetch_gzip_urls on a sub-sitemap, skipping it with a warning if
+    it cannot be downloaded, decompressed or parsed. '''
+
+    try:
+        return fetch_gzip_urls(url, cache=cache)
+    except SKIPPED_ERRORS as e:
+        print('Warning - skipping unreadable XML file %s (%s)' % (url, e))
+        return []
+
+
+def iter_all_gzip_urls(sitemap_url, cache=False):
+    ''' Loop over fetch_sub_gzip_urls function for all XML pages, yielding the
+    URLs found on each page as it is processed. Index XML page is assumed
+    to be unzipped. '''
 
     # Get list of .xml.gz files
-    urls = get_urls(sitemap_url)
-    urls_gz = [u for u in urls if u[-3:] == '.gz']
-    for i, url in enumerate((set(urls) - set(urls_gz))):
+    urls_gz, urls_not_gz = split_gzip_urls(get_urls(sitemap_url))
+    for i, url in enumerate(urls_not_gz):
         if i == 0:
             print('Warning - ignoring the following non-gzip files:')
         print(url)
     urls = urls_gz
 
-    # Download the sitemap files
-    for i, url in enumerate(urls):
-        filename = url.split('/')[-1]
-        page = requests.get(url)
-        with open('gzip-sitemaps/' + filename, 'wb') as f:
-            f.write(page.content)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        for i, links in enumerate(ex.map(partial(fetch_sub_gzip_urls, cache=cache), urls)):
+            if (i+1) % 64 == 0 or i+1 == len(urls):
+                print('Searched through %s XML file(s)' % (i+1), end='\r')
+            yield links
 
-    # Extract urls from sitemap files
-    sitemap_urls = []
-    all_sitemaps = glob.glob('gzip-sitemaps/*.gz')
-    for i, f_ in enumerate(all_sitemaps):
-        links = get_gzip_urls(f_)
-        print('Searched through %s XML file(s)' % (i+1), end='\r')
-        sitemap_urls += links
 
-    return sitemap_urls
+def main():
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', type=str,
+                        help='Link to XML sitemap')
+    parser.add_argument('--not_index', action='store_true',
+                        help='Does the given URL contain the sitemap directly?')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Are the XML files in gzip (.gz) format?')
+    parser.add_argument('--cache', action='store_true',
+                        help='Save the gzip (.gz) files to gzip-sitemaps?')
+    args = parser.parse_args()
+
+    # Update variables with arguments if specified
+    url = sitemap_url
+    is_index = sitemap_is_index
+    is_gzip = sitemap_is_gzip
+    cache = cache_gzip
+
+    if args.url:
+        url = args.url
+    else:
+        print('No sitemap URL argument passed, using %s.' % url)
+        print('Read usage details in file header for more information on passing arguments.')
 
-def main():
+    if args.not_index:
+        is_index = False
+
+    if args.gzip:
+        is_gzip = True
+
+    if args.cache:
+        cache = True
 
     # If the XML files are not compressed
-    if not sitemap_is_gzip:
+    if not is_gzip:
 
         # If the XML sitemap is an index to other XML files
-        if sitemap_is_index:
-            sitemap_urls = get_all_urls(sitemap_url)
+        if is_index:
+            sitemap_urls = iter_all_urls(url)
 
         # If the XML sitemap contains the page links directly
-        if not sitemap_is_index:
-            sitemap_urls = get_urls(sitemap_url)
+        if not is_index:
+            sitemap_urls = [get_urls(url)]
 
     # If the XML files are compressed
     else:
 
         # Make a folder to hold gzip files
-        if not os.path.exists('gzip-sitemaps'):
+        if cache and not os.path.exists('gzip-sitemaps'):
             os.makedirs('gzip-sitemaps')
 
         # If the XML sitemap is an index to other XML files
-        if sitemap_is_index:
-            sitemap_urls = get_all_gzip_urls(sitemap_url)
+        if is_index:
+            sitemap_urls = iter_all_gzip_urls(url, cache=cache)
 
         # If the XML sitemap contains the page links directly
-        if not sitemap_is_index:
-            filename = sitemap_url.split('/')[-1]
-            page = requests.get(sitemap_url)
-            with open('gzip-sitemaps/' + filename, 'wb') as f:
-                f.write(page.content)
-            sitemap_urls = get_gzip_urls('gzip-sitemaps/' + filename)
-
-    # Print the URLs to a file
-    with open('sitemap_urls.dat', 'w') as f:
-        for url in sitemap_urls:
-            f.write(url + '\n')
+        if not is_index:
+            sitemap_urls = [fetch_gzip_urls(url, cache=cache)]
+
+    # Print the URLs to a temporary file as each XML page is processed, then
+    # move it into place once every page has been read
+    n_urls = 0
+    try:
+        with open('sitemap_urls.dat.tmp', 'w') as f:
+            for links in sitemap_urls:
+                f.writelines(link + '\n' for link in links)
+                n_urls += len(links)
+        os.replace('sitemap_urls.dat.tmp', 'sitemap_urls.dat')
+    except BaseException:
+        if os.path.exists('sitemap_urls.dat.tmp'):
+            os.remove('sitemap_urls.dat.tmp')
+        raise
 
     # Print the number of URLs found
     print('Found {:,} URLs in the sitemap and saved them to sitemap_urls.dat'\
-            .format(len(sitemap_urls)))
+            .format(n_urls))
 
 
 if __name__ == '__main__':
@@ -1,8 +1,10 @@
 '''
 Visualize a list of URLs by site path.
 
-This script reads in the sitemap_layers.csv file created by the
+This script reads in the sitemap_layers.parquet file created by the
 categorize_urls.py script and builds a graph visualization using Graphviz.
+If sitemap_layers.csv is newer, or there is no parquet file, then the CSV
+file is read instead.
 
 Graph depth can be specified by executing a call like this in the
 terminal:
@@ -33,37 +35,11 @@ skip = ''        # List of branches to restrict from expanding
 import pandas as pd
 import graphviz
 import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument('--depth', type=int, default=graph_depth,
-                    help='Number of layers deep to plot categorization')
-parser.add_argument('--limit', type=int, default=limit,
-                    help='Maximum number of nodes for a branch')
-parser.add_argument('--title', type=str, default=title,
-                    help='Graph title')
-parser.add_argument('--style', type=str, default=style,
-                    help='Graph style, can be "light" or "dark"')
-parser.add_argument('--size', type=str, default=size,
-                    help='Size of rendered graph')
-parser.add_argument('--output-format', type=str, default=output_format,
-                    help='Format of the graph you want to save. Allowed formats are jpg, png, pdf or tif')
-parser.add_argument('--skip', type=str, default=skip,
-        help="List of branches that you do not want to expand. Comma separated: e.g. --skip 'news,events,datasets'")
-args = parser.parse_args()
-
-
-# Update variables with arguments if included
-
-graph_depth = args.depth
-limit = args.limit
-title = args.title
-style = args.style
-size = args.size
-output_format = args.output_format
-skip = args.skip.split(',')
+import os
 
 # Main script functions
 
-def make_sitemap_graph(df, layers=graph_depth, limit=limit, size=size, output_format=output_format, skip=skip):
+def make_sitemap_graph(df, layers=graph_depth, limit=limit, size=size, output_format=output_format, skip=skip.split(',')):
     ''' Make a sitemap graph up to a specified layer depth.
 
     sitemap_layers : DataFrame
@@ -91,32 +67,38 @@ def make_sitemap_graph(df, layers=graph_depth, limit=limit, size=size, output_fo
         print('There are only %d layers available to plot, setting layers=%d'
               % (layers, layers))
 
+    # Column names of each layer in the dataframe
+    col_names = [str(i_) for i_ in range(layers+1)]
+
 
     # Initialize graph
     f = graphviz.Digraph('sitemap', filename='sitemap_graph_%d_layer' % layers, format='%s' % output_format)
     f.body.extend(['rankdir=LR', 'size="%s"' % size])
 
+    # Keep track of the node names added to the graph
+    added_nodes = set()
 
-    def add_branch(f, names, vals, limit, connect_to=''):
-        ''' Adds a set of nodes and edges to nodes on the previous layer. '''
 
-        # Get the currently existing node names
-        node_names = [item.split('"')[1] for item in f.body if 'label' in item]
+    def add_branch(f, added_nodes, names, vals, limit, connect_to=''):
+        ''' Adds a set of nodes and edges to nodes on the previous layer. '''
 
         # Only add a new branch it it will connect to a previously created node
         if connect_to:
-            if connect_to in node_names:
-                for name, val in list(zip(names, vals))[:limit]:
-                    f.node(name='%s-%s' % (connect_to, name), label=name)
-                    f.edge(connect_to, '%s-%s' % (connect_to, name), label='{:,}'.format(val))
+            if connect_to in added_nodes:
+                for name, val in zip(names[:limit], vals[:limit]):
+                    node_name = '%s-%s' % (connect_to, name)
+                    f.node(name=node_name, label=name)
+                    f.edge(connect_to, node_name, label='{:,}'.format(val))
+                    added_nodes.add(node_name)
 
 
     f.attr('node', shape='rectangle') # Plot nodes as rectangles
 
     # Add the first layer of nodes
-    for name, counts in df.groupby(['0'])['counts'].sum().reset_index()\
+    for name, counts in df.groupby(col_names[:1], observed=True)['counts'].sum().reset_index()\
                           .sort_values(['counts'], ascending=False).values:
         f.node(name=name, label='{} ({:,})'.format(name, counts))
+        added_nodes.add(name)
 
     if layers == 0:
         return f
@@ -126,29 +108,30 @@ def make_sitemap_graph(df, layers=graph_depth, limit=limit, size=size, output_fo
 
     # Loop over each layer adding nodes and edges to prior nodes
     for i in range(1, layers+1):
-        cols = [str(i_) for i_ in range(i)]
-        nodes = df[cols].drop_duplicates().values
-        for j, k in enumerate(nodes):
+        cols = col_names[:i]
 
-            # Compute the mask to select correct data
-            mask = True
-            for j_, ki in enumerate(k):
-                mask &= df[str(j_)] == ki
+        # Count branch sizes for every node in this layer at once
+        layer_counts = df.groupby(col_names[:i+1], observed=True, sort=False)['counts'].sum()\
+                         .reset_index()
+        nodes = layer_counts.groupby(cols, observed=True, sort=False)
+        for j, (k, data) in enumerate(nodes):
+            if not isinstance(k, tuple):
+                k = (k,)
 
-            # Select the data then count branch size, sort, and truncate
-            data = df[mask].groupby([str(i)])['counts'].sum()\
-                    .reset_index().sort_values(['counts'], ascending=False)
+            # Sort and truncate
+            data = data.sort_values(['counts'], ascending=False)
 
             # Add to the graph unless specified that we do not want to expand k-1
             if (not skip) or (k[-1] not in skip):
-                add_branch(f,
-                       names=data[str(i)].values,
+                add_branch(f, added_nodes,
+                       names=data[col_names[i]].values,
                        vals=data['counts'].values,
                        limit=limit,
-                       connect_to='-'.join(['%s']*i) % tuple(k))
+                       connect_to='-'.join(['%s']*i) % k)
 
-            print(('Built graph up to node %d / %d in layer %d' % (j, len(nodes), i))\
-                    .ljust(50), end='\r')
+            if (j+1) % 64 == 0 or j+1 == nodes.ngroups:
+                print(('Built graph up to node %d / %d in layer %d' % (j, nodes.ngroups, i))\
+                        .ljust(50), end='\r')
 
     return f
 
@@ -231,20 +214,45 @@ def apply_style(f, style, title=''):
 
 def main():
 
-    # Read in categorized data
-    sitemap_layers = pd.read_csv('sitemap_layers.csv', dtype=str)
-    # Convert numerical column to integer
-    sitemap_layers.counts = sitemap_layers.counts.apply(int)
-    print('Loaded {:,} rows of categorized data from sitemap_layers.csv'\
-            .format(len(sitemap_layers)))
-
-    print('Building %d layer deep sitemap graph' % graph_depth)
-    f = make_sitemap_graph(sitemap_layers, layers=graph_depth,
-                            limit=limit, size=size, output_format=output_format, skip=skip)
-    f = apply_style(f, style=style, title=title)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--depth', type=int, default=graph_depth,
+                        help='Number of layers deep to plot categorization')
+    parser.add_argument('--limit', type=int, default=limit,
+                        help='Maximum number of nodes for a branch')
+    parser.add_argument('--title', type=str, default=title,
+                        help='Graph title')
+    parser.add_argument('--style', type=str, default=style,
+                        help='Graph style, can be "light" or "dark"')
+    parser.add_argument('--size', type=str, default=size,
+                        help='Size of rendered graph')
+    parser.add_argument('--output-format', type=str, default=output_format,
+                        help='Format of the graph you want to save. Allowed formats are jpg, png, pdf or tif')
+    parser.add_argument('--skip', type=str, default=skip,
+            help="List of branches that you do not want to expand. Comma separated: e.g. --skip 'news,events,datasets'")
+    args = parser.parse_args()
+
+    # Read in categorized data from the most recently written file
+    filenames = [fn for fn in ('sitemap_layers.parquet', 'sitemap_layers.csv')
+                 if os.path.exists(fn)]
+    filename = max(filenames, key=os.path.getmtime) if filenames\
+               else 'sitemap_layers.csv'
+    if filename.endswith('.parquet'):
+        sitemap_layers = pd.read_parquet(filename)
+    else:
+        sitemap_layers = pd.read_csv(filename, dtype=str)
+        # Convert numerical column to integer
+        sitemap_layers['counts'] = pd.to_numeric(sitemap_layers['counts'], downcast='unsigned')
+    print('Loaded {:,} rows of categorized data from {}'\
+            .format(len(sitemap_layers), filename))
+
+    print('Building %d layer deep sitemap graph' % args.depth)
+    f = make_sitemap_graph(sitemap_layers, layers=args.depth,
+                            limit=args.limit, size=args.size, output_format=args.output_format,
+                            skip=args.skip.split(','))
+    f = apply_style(f, style=args.style, title=args.title)
 
     f.render(cleanup=True)
-    print('Exported graph to sitemap_graph_%d_layer.%s' % (graph_depth, output_format))
+    print('Exported graph to sitemap_graph_%d_layer.%s' % (args.depth, args.output_format))
 
 
 if __name__ == '__main__':